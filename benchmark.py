@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import ctypes
+import os
+import settings
+from synop import processSynop
+from synop import processSynopBytes
+import sys
+import tempfile
+import time
+
+# SYNOP reports as passed to the parsers by bulletin.synopBulletin, i.e. without station identifier
+sampleReports = [
+    '32970 /2105 10123 20045 30012 40123 57010 60001 70222 333 55045 91015',
+    '41/// 02310 11023 21045 39912 4//// 333 4/005 55032 70012',
+    '12970 99110 00120 10223 20112 30112 60102 333 55300 56999 91120 555 1234',
+    '32970 02105 11023 2//// 39512 333 4/997 70120',
+    '11458 70000 10060 21033 30123 40150 52010 69901 333 20045 4/998 55010 55305 60017 79999 91099 00105'
+]
+
+# station of the sample reports, it is in the station inventory so that the QFF is computed as well
+sampleStation = {'wmo': '11035', 'ele': '198', 'lat': '48.25'}
+
+# glibc library with the mtrace function, which logs every malloc call to the file in MALLOC_TRACE
+mallocDebugLibrary = 'libc_malloc_debug.so.0'
+
+parsers = [('text', processSynop), ('bytes', processSynopBytes)]
+
+# compares the text and the bytes parser on the sample reports
+# with the -a option the malloc calls per report are counted instead of measuring the time
+def main():
+
+    parser = argparse.ArgumentParser(description='Measures time or memory allocations per report of the text and the bytes parser.')
+    parser.add_argument('-n', '--reports', dest='reports',
+                        metavar='reports',
+                        help='Number of reports decoded by each parser. Defaults to 100000, or 1000 when counting allocations.',
+                        required=False,
+                        type=int,
+                        default=None)
+    parser.add_argument('-a', '--allocations', dest='allocations',
+                        help='count memory allocations instead of measuring the time (requires Python 3 and glibc 2.34 or newer)',
+                        action='store_true')
+    args = parser.parse_args()
+
+    if args.reports == None:
+        # every allocation is a line in the trace file
+        args.reports = 1000 if args.allocations else 100000
+    if args.reports < 1:
+        sys.exit('The number of reports has to be at least 1. Exiting.')
+
+    setupSamples()
+
+    if args.allocations:
+        if sys.version_info[0] < 3:
+            sys.exit('Counting allocations requires Python 3. Exiting.')
+        if 'MALLOC_TRACE' not in os.environ:
+            # the Python allocator has to be bypassed and the debug library loaded from the start of the process,
+            # so run again in an environment set up for it
+            traceFile, traceFileName = tempfile.mkstemp(suffix='.mtrace')
+            os.close(traceFile)
+            environment = dict(os.environ, PYTHONMALLOC='malloc', LD_PRELOAD=mallocDebugLibrary, MALLOC_TRACE=traceFileName)
+            os.execve(sys.executable, [sys.executable] + sys.argv, environment)
+
+    for name, decodeSynop in parsers:
+        reports = [report.encode('ascii') if name == 'bytes' else report for report in sampleReports]
+        reports = (reports * (args.reports // len(reports) + 1))[:args.reports]
+        if args.allocations:
+            result = str(round(countAllocations(decodeSynop, reports) / float(len(reports)), 1)) + ' allocations'
+        else:
+            result = str(round(measureTime(decodeSynop, reports) / len(reports) * 1000000, 1)) + ' us'
+        print(name + ' parser: ' + result + ' per report.')
+
+def setupSamples():
+    settings.verbose = False
+    settings.stationInventory = {sampleStation['wmo']: sampleStation}
+
+# returns the time in seconds decoding the reports took
+def measureTime(decodeSynop, reports):
+    # every report prints a progress line
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        for report in reports:
+            decodeSynop(sampleStation['wmo'], None, 1, 'SMXX01', 'XXXX', None, None, report)
+        return time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+# returns the number of malloc calls made while decoding the reports
+# every allocation is a malloc call because the Python allocator is bypassed (PYTHONMALLOC=malloc)
+def countAllocations(decodeSynop, reports):
+    mtrace, muntrace = traceFunctions()
+    traceFileName = os.environ['MALLOC_TRACE']
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        # first call outside of the trace, it sets up e.g. caches of the interpreter
+        decodeSynop(sampleStation['wmo'], None, 1, 'SMXX01', 'XXXX', None, None, reports[0])
+        mtrace()
+        for report in reports:
+            decodeSynop(sampleStation['wmo'], None, 1, 'SMXX01', 'XXXX', None, None, report)
+        muntrace()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    # mtrace logs allocations as lines @ caller + address size
+    count = 0
+    traceFile = open(traceFileName, 'r')
+    for line in traceFile:
+        if ' + ' in line:
+            count += 1
+    traceFile.close()
+    os.remove(traceFileName)
+    return count
+
+# mtrace and muntrace of the preloaded debug library
+def traceFunctions():
+    try:
+        library = ctypes.CDLL(mallocDebugLibrary)
+        loader = ctypes.CDLL(None)
+        loader.dlsym.restype = ctypes.c_void_p
+        loader.dlvsym.restype = ctypes.c_void_p
+    except (OSError, AttributeError):
+        sys.exit('Could not load ' + mallocDebugLibrary + ', counting allocations requires glibc 2.34 or newer. Exiting.')
+
+    functions = []
+    for name in [b'mtrace', b'muntrace']:
+        address = traceFunctionAddress(loader, ctypes.c_void_p(library._handle), name)
+        if address == None:
+            sys.exit('Could not find ' + name.decode('ascii') + ' in ' + mallocDebugLibrary + '. Exiting.')
+        functions.append(ctypes.CFUNCTYPE(None)(address))
+    return functions
+
+# first symbol versions of glibc, which differ by machine, e.g. GLIBC_2.2.5 on x86_64 and GLIBC_2.17 on aarch64
+glibcBaseVersions = [b'GLIBC_2.0', b'GLIBC_2.2', b'GLIBC_2.2.5', b'GLIBC_2.3', b'GLIBC_2.4', b'GLIBC_2.16', b'GLIBC_2.17',
+    b'GLIBC_2.18', b'GLIBC_2.21', b'GLIBC_2.27', b'GLIBC_2.29', b'GLIBC_2.32', b'GLIBC_2.35', b'GLIBC_2.36']
+
+# libc itself contains stubs with the same names which do nothing
+# the functions of the library are not the default version of the symbol, so a plain lookup may find the stub instead
+# in that case they are looked up by the first symbol version of glibc on this machine
+def traceFunctionAddress(loader, library, name):
+    stub = loader.dlsym(ctypes.c_void_p(None), name)
+    address = loader.dlsym(library, name)
+    if address and address != stub:
+        return address
+    for version in glibcBaseVersions:
+        address = loader.dlvsym(library, name, version)
+        if address and address != stub:
+            return address
+    return None
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,11 @@ from lib import verbosePrint
 import re
 import settings
 from synop import processSynop
+from synop import processSynopBytes
 
+# returns the list of records decoded from the bulletin
 def processBulletin(bulletin, count, basedate):
+    records = []
     modifierType = None
     modifierSequence = None
     windIndicator = None
@@ -48,11 +51,14 @@ def processBulletin(bulletin, count, basedate):
             bulletin = bulletin[4:]
 
         if bulletinType == 'SI' or bulletinType == 'SM' or bulletinType == 'SN':
-            synopBulletin(bulletin, basedate, bulletinId, bulletinIssuer, modifierType, modifierSequence)
+            records = synopBulletin(bulletin, basedate, bulletinId, bulletinIssuer, modifierType, modifierSequence)
     else:
         verbosePrint('discarding non-SYNOP/METAR/TEMP or geographically irrelevant bulletin.')
 
+    return records
+
 def synopBulletin(bulletin, basedate, bulletinId, bulletinIssuer, modifierType, modifierSequence):
+    records = []
     mixedBulletin = False
 
     # decide whether MMMM group (e.g. AAXX) occurs only once or more often
@@ -60,26 +66,27 @@ def synopBulletin(bulletin, basedate, bulletinId, bulletinIssuer, modifierType,
     if bulletin.count('XX') <= 1:
         if not bulletin.startswith('AAXX'):
             verbosePrint('discarding bulletin not containing data from fixed surface land stations.')
-            return
+            return records
         # consume MMMM and YYGGi group which is valid for the entire bulletin
         bulletin = bulletin[4:]
         try:
             windIndicator = int(bulletin[5:6])
         except ValueError:
             windIndicator = -1
-        day = bulletin[1:3]
-        hour = bulletin[3:5]
-
-        year = basedate.year
-        month = basedate.month
-        if int(day) > int(basedate.day):
-            month -= 1
-        timestamp = datetime.datetime(year, month, int(day), int(hour))
+        timestamp = reportTimestamp(basedate, bulletin[1:3], bulletin[3:5])
+        if timestamp == None:
+            verbosePrint('discarding bulletin with invalid day and hour ' + bulletin[1:5] + ' for base date ' + basedate.strftime('%Y-%m-%d') + '.')
+            return records
         print('timestamp: ' + str(timestamp))
         bulletin = bulletin[7:]
     else:
         mixedBulletin = True
 
+    if settings.parser == 'bytes':
+        decodeSynop = processSynopBytes
+    else:
+        decodeSynop = processSynop
+
     # we have now reached the level of individual stations
     stations = bulletin.split('=')
     for station in stations:
@@ -99,20 +106,32 @@ def synopBulletin(bulletin, basedate, bulletinId, bulletinIssuer, modifierType,
                 # consume MMMM and YYGGi group of station
                 station = station[4:]
                 windIndicator =  int(station[5:6])
-                day = station[1:3]
-                hour = station[3:5]
-
-                year = basedate.year
-                month = basedate.month
-                if day > basedate.day:
-                    month -= 1
-                timestamp = datetime.datetime(year, month, int(day), int(hour))
+                timestamp = reportTimestamp(basedate, station[1:3], station[3:5])
+                if timestamp == None:
+                    verbosePrint('discarding station report with invalid day and hour ' + station[1:5] + ' for base date ' + basedate.strftime('%Y-%m-%d') + '.')
+                    continue
                 print('day: ' + str(timestamp))
                 station = station[7:]
         # consume IIiii (station number)
         stationId = station[:5]
-        if not settings.stationList or int(stationId) in settings.stationList:
+        if settings.stationList == None or int(stationId) in settings.stationList:
             station = station[6:]
-            processSynop(stationId, timestamp, windIndicator, bulletinId, bulletinIssuer, modifierType, modifierSequence, station)
+            records.append(decodeSynop(stationId, timestamp, windIndicator, bulletinId, bulletinIssuer, modifierType, modifierSequence, station))
         else:
             verbosePrint('discarding report from station ' + stationId + ', not in list.')
+
+    return records
+
+# timestamp of a report from the day and hour of its YYGGi group
+# days after the day of the base date belong to the month before the base date
+# returns None if day or hour are invalid, e.g. if the day does not exist in that month
+def reportTimestamp(basedate, day, hour):
+    try:
+        day = int(day)
+        hour = int(hour)
+        if day > basedate.day:
+            previousMonth = basedate.replace(day=1) - datetime.timedelta(days=1)
+            return datetime.datetime(previousMonth.year, previousMonth.month, day, hour)
+        return datetime.datetime(basedate.year, basedate.month, day, hour)
+    except ValueError:
+        return None
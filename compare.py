@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+from benchmark import sampleReports
+from benchmark import sampleStation
+from benchmark import setupSamples
+import os
+import random
+from synop import processSynop
+from synop import processSynopBytes
+import sys
+
+# reports with fields int() or float() accept although they are not only digits
+edgeReports = [
+    '12470 80512 10.5 20051 39945',
+    '12470 80512 101e2 20051 39945',
+    '12470 80512 1nan 2-005 3+994',
+    '12470 8 512 1 -05 20 51 39945 333 4/ 12 55.10 7 1e1'
+]
+
+# characters and groups inserted into the sample reports when mutating them
+mutationCharacters = '0123456789/ -+.en'
+mutationGroups = ['333', '555', '553', '55', '910', '00', '99', '9', '29', '2', '1', '/', '.5', '1e2', 'nan', 'inf']
+
+# checks that the bytes parser returns the same records as the text parser
+# on the sample reports and on randomly mutated, i.e. mostly invalid, variants of them
+def main():
+
+    parser = argparse.ArgumentParser(description='Compares the records of the text and the bytes parser.')
+    parser.add_argument('-n', '--reports', dest='reports',
+                        metavar='reports',
+                        help='Number of mutated reports to compare. Defaults to 200000.',
+                        required=False,
+                        type=int,
+                        default=200000)
+    parser.add_argument('-s', '--seed', dest='seed',
+                        metavar='seed',
+                        help='Seed of the random mutations. Defaults to 1.',
+                        required=False,
+                        type=int,
+                        default=1)
+    args = parser.parse_args()
+
+    setupSamples()
+    random.seed(args.seed)
+
+    reports = sampleReports + edgeReports + [mutateReport(random.choice(sampleReports)) for i in range(args.reports)]
+    mismatches = 0
+    # every report prints a progress line
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        for report in reports:
+            for windIndicator in [-1, 1, 4]:
+                textResult = decodeReport(processSynop, windIndicator, report)
+                bytesResult = decodeReport(processSynopBytes, windIndicator, report.encode('ascii'))
+                if textResult != bytesResult:
+                    mismatches += 1
+                    if mismatches <= 10:
+                        print('Mismatch for report ' + repr(report) + ' with wind indicator ' + str(windIndicator)
+                            + ':\n  text:  ' + textResult + '\n  bytes: ' + bytesResult, file=stdout)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    if mismatches:
+        sys.exit(str(mismatches) + ' of ' + str(len(reports) * 3) + ' decoded reports differ. Exiting.')
+    print('All ' + str(len(reports) * 3) + ' decoded reports are identical.')
+
+# deletes, inserts, replaces or cuts off characters at random positions
+def mutateReport(report):
+    report = list(report)
+    for i in range(random.randint(0, 4)):
+        operation = random.randint(0, 3)
+        position = random.randint(0, len(report))
+        if operation == 0 and report:
+            del report[min(position, len(report) - 1)]
+        elif operation == 1:
+            report[position:position] = list(random.choice(mutationGroups))
+        elif operation == 2 and report:
+            report[min(position, len(report) - 1)] = random.choice(mutationCharacters)
+        else:
+            report = report[:position]
+    return ''.join(report)
+
+# the decoded record or the type of error as text, so that results can be compared and printed
+def decodeReport(decodeSynop, windIndicator, report):
+    try:
+        return repr(sorted(decodeSynop(sampleStation['wmo'], None, windIndicator, 'SMXX01', 'XXXX', None, None, report).items()))
+    except Exception as e:
+        return 'error ' + type(e).__name__
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,23 @@
 
 from __future__ import print_function
 import argparse
-from bulletin import processBulletin
 import csv
 import datetime
+from geo import buildStationGrid
+from geo import stationsInBox
+from geo import stationsInPolygon
+from geo import stationsInRadius
 import glob
-from output import writeCsvOutput
-from output import writeSqliteOutput
+from lib import verbosePrint
+import os
+from output import outputTypes
+from pipeline import runPipeline
 import re
 import settings
 import StringIO
 import sys
 import yaml
 
-# use NOAA bulletin separator line to split up bulletins
-bulletinSeparator = '####[0-9]{9}####'
-
 def main():
 
     parser = argparse.ArgumentParser(description='Parses NOAA TAC bulletins (SYNOP, METAR, TEMP).')
@@ -37,9 +39,15 @@ def main():
                         action='store_true')
     parser.add_argument('-t', '--type', dest='outputtype',
                         metavar='output-type',
-                        help='Method of saving decoded data. One of csv (simple) and sqlite (full feature set). Defaults to sqlite.',
+                        help='Method of saving decoded data. One of csv (simple), parquet (columnar version of csv, requires pyarrow), sqlite (full feature set) and socket (send to the writer service listening on the socket given as output file, see writer.py). Defaults to sqlite.',
                         required=False,
                         default='sqlite')
+    parser.add_argument('-s', '--sink', dest='sinks',
+                        metavar='type:file',
+                        help='Additional output written from the same decoded data, e.g. csv:partners.csv. Can be given several times, types are the same as for --type.',
+                        required=False,
+                        action='append',
+                        default=[])
     parser.add_argument('-f', '--filter', dest='filterfile',
                         metavar='filter-file',
                         help='YAML file specifying country and station filters',
@@ -50,23 +58,119 @@ def main():
                         help='(yyyy-mm-dd) only day of month is encoded, so it is necessary to know which values belong to which month (and which year). Defaults to today.',
                         required=False,
                         default=datetime.date.today())
+    parser.add_argument('-w', '--workers', dest='workers',
+                        metavar='workers',
+                        help='Number of decoder threads running alongside the reader and the writer. Defaults to 1.',
+                        required=False,
+                        type=int,
+                        default=1)
+    parser.add_argument('-b', '--batch-size', dest='batchSize',
+                        metavar='batch-size',
+                        help='Number of records written to the output in one transaction. Defaults to 1000.',
+                        required=False,
+                        type=int,
+                        default=1000)
+    parser.add_argument('-q', '--queue-size', dest='queueSize',
+                        metavar='queue-size',
+                        help='Number of bulletins and decoded bulletins buffered between reading, decoding and writing. Defaults to 100.',
+                        required=False,
+                        type=int,
+                        default=100)
+    parser.add_argument('-p', '--parser', dest='parser',
+                        metavar='parser',
+                        help='How reports are parsed. One of text (slicing the report text) and bytes (reading fields in place, fewer allocations but slower than text under Python 2, see benchmark.py). Both give the same results. Defaults to text.',
+                        required=False,
+                        choices=['text', 'bytes'],
+                        default='text')
+    parser.add_argument('--wal', dest='wal',
+                        help='switch the Sqlite output to WAL mode, so that readers and the writer do not block each other',
+                        action='store_true')
+    parser.add_argument('--busy-timeout', dest='busyTimeout',
+                        metavar='seconds',
+                        help='How long to wait for other processes to release the lock of the Sqlite output. Defaults to 30.',
+                        required=False,
+                        type=float,
+                        default=30)
+    parser.add_argument('-P', '--processes', dest='processes',
+                        help='run the decoder workers as processes instead of threads, so that decoding uses several CPUs',
+                        action='store_true')
+    parser.add_argument('-B', '--backfill', dest='backfill',
+                        metavar='date-source',
+                        help='Infer the base date of every input file instead of using one base date for all, can not be combined with --date. One of filename (see --date-pattern), mtime (day of last modification in UTC) and manifest (see --manifest).',
+                        required=False,
+                        choices=['filename', 'mtime', 'manifest'],
+                        default=None)
+    parser.add_argument('--date-pattern', dest='datePattern',
+                        metavar='date-pattern',
+                        help='Regular expression with the groups year, month and day finding the base date in input file names. Defaults to yyyymmdd or yyyy-mm-dd.',
+                        required=False,
+                        default='(?P<year>[0-9]{4})-?(?P<month>[0-9]{2})-?(?P<day>[0-9]{2})')
+    parser.add_argument('--manifest', dest='manifest',
+                        metavar='manifest-file',
+                        help='YAML file mapping input file names to their base dates (yyyy-mm-dd)',
+                        required=False,
+                        default=None)
+    parser.add_argument('-i', '--index', dest='index',
+                        help='write a sidecar index (input file name + .idx) listing the bulletins of every input file with their header and position',
+                        action='store_true')
+    parser.add_argument('--bulletins', dest='selectBulletins',
+                        metavar='bulletins',
+                        help='decode only bulletins whose TTAAii starts with one of these comma separated prefixes, e.g. SN or SMOS01',
+                        required=False,
+                        default=None)
+    parser.add_argument('--issuers', dest='selectIssuers',
+                        metavar='issuers',
+                        help='decode only bulletins from these comma separated issuers (CCCC), e.g. LOWM',
+                        required=False,
+                        default=None)
+    parser.add_argument('--sequence', dest='selectSequence',
+                        metavar='from-to',
+                        help='decode only bulletins with a NOAA sequence number in this range, e.g. 18012340-18012399',
+                        required=False,
+                        default=None)
     args = parser.parse_args()
 
     for name, value in vars(args).items():
         setattr(settings, name, value)
-    setattr(settings, 'decodedData', [])
 
-    if settings.outputtype != 'csv' and settings.outputtype != 'sqlite':
-        sys.exit('The specified output type is none of the allowed values csv or sqlite. Exiting.')
+    sinks = [(settings.outputtype, settings.output)]
+    for sink in settings.sinks:
+        if ':' not in sink:
+            sys.exit('The specified sink ' + sink + ' is not of the form type:file. Exiting.')
+        sinks.append(tuple(sink.split(':', 1)))
+    for outputType, outputFile in sinks:
+        if outputType not in outputTypes:
+            sys.exit('The specified output type ' + outputType + ' is none of the allowed values csv, parquet, sqlite or socket. Exiting.')
+
+    if settings.workers < 1 or settings.batchSize < 1 or settings.queueSize < 1:
+        sys.exit('The number of workers, the batch size and the queue size have to be at least 1. Exiting.')
+
+    # bulletin selection, bulletins are read using the sidecar index of an input file if it exists
+    if settings.selectBulletins != None:
+        settings.selectBulletins = settings.selectBulletins.split(',')
+    if settings.selectIssuers != None:
+        settings.selectIssuers = set(settings.selectIssuers.split(','))
+    if settings.selectSequence != None:
+        try:
+            first, last = settings.selectSequence.split('-')
+            settings.selectSequence = (int(first), int(last))
+            # an empty range would select nothing
+            if settings.selectSequence[0] > settings.selectSequence[1]:
+                raise ValueError
+        except ValueError:
+            sys.exit('The specified sequence range has to be of the form from-to with from not greater than to. Exiting.')
 
     if isinstance(settings.basedate, str):
+        if settings.backfill != None:
+            sys.exit('A base date can not be specified when backfilling, the base dates are inferred for every input file. Exiting.')
         try:
             settings.basedate = datetime.datetime.strptime(settings.basedate, '%Y-%m-%d')
         except ValueError:
             sys.exit('The specified base date seems to be invalid. Exiting.')
 
-    setupFilter()
+    # regions in the filter are resolved against the station inventory
     setupStationInventory()
+    setupFilter()
 
     if settings.filelist:
         try:
@@ -79,41 +183,60 @@ def main():
     else:
         inputFiles = glob.glob(settings.input)
 
-    for inputFileName in inputFiles:
-        print()
-        print('Processing input file ' + inputFileName + '.')
-        data = ''
+    inputFiles = setupBaseDates(inputFiles)
+
+    runPipeline(inputFiles, sinks)
+
+# returns the input files as (file name, base date) tuples
+def setupBaseDates(inputFiles):
+    if settings.backfill == None:
+        return [(inputFileName, settings.basedate) for inputFileName in inputFiles]
+
+    if settings.backfill == 'filename':
         try:
-            inputFile = open(inputFileName, 'r')
-            data = inputFile.read()
-            inputFile.close()
-            # convert newlines into spaces and remove carriage returns
-            data = data.replace('\n', ' ')
-            data = data.replace('\r', '')
-            # collapse spaces
-            data = ' '.join(data.split())
+            datePattern = re.compile(settings.datePattern)
+        except re.error:
+            sys.exit('The specified date pattern is not a valid regular expression. Exiting.')
+    elif settings.backfill == 'manifest':
+        if not settings.manifest:
+            sys.exit('Backfilling with base dates from a manifest requires a manifest file. Exiting.')
+        try:
+            manifestFile = open(settings.manifest, 'r')
+            manifest = yaml.safe_load(manifestFile.read())
+            manifestFile.close()
         except IOError:
-            sys.exit('Could not read input file ' + inputFileName + ', please check if it exists. Exiting.')
+            sys.exit('Could not read manifest file, please check if it exists. Exiting.')
+        if not isinstance(manifest, dict):
+            sys.exit('The manifest file has to map input file names to base dates. Exiting.')
 
-        # specify regular expression of what separates bulletins in the text file
-        bulletins = re.split(bulletinSeparator, data)
-
-        count = 0
-        for bulletin in bulletins:
-            bulletin = bulletin.strip()
-            # first one will be usually empty
-            if len(bulletin) == 0:
-                continue
-            count += 1
-            processBulletin(bulletin, count, settings.basedate)
+    inputFilesWithDates = []
+    for inputFileName in inputFiles:
+        basedate = None
+        try:
+            if settings.backfill == 'filename':
+                match = datePattern.search(os.path.basename(inputFileName))
+                if match:
+                    basedate = datetime.date(int(match.group('year')), int(match.group('month')), int(match.group('day')))
+            elif settings.backfill == 'mtime':
+                basedate = datetime.datetime.utcfromtimestamp(os.path.getmtime(inputFileName)).date()
+            elif settings.backfill == 'manifest':
+                # files may be listed with the path as given or by their name only
+                basedate = manifest.get(inputFileName, manifest.get(os.path.basename(inputFileName)))
+                # YAML reads unquoted dates as dates already
+                if isinstance(basedate, str):
+                    basedate = datetime.datetime.strptime(basedate, '%Y-%m-%d').date()
+        except (IndexError, OSError, ValueError):
+            basedate = None
+        if not isinstance(basedate, datetime.date):
+            sys.exit('Could not determine the base date of input file ' + inputFileName + '. Exiting.')
+        verbosePrint('base date of input file ' + inputFileName + ': ' + basedate.strftime('%Y-%m-%d'))
+        inputFilesWithDates.append((inputFileName, basedate))
 
-    if settings.outputtype == 'csv':
-        writeCsvOutput()
-    elif settings.outputtype == 'sqlite':
-        writeSqliteOutput()
+    return inputFilesWithDates
 
 def setupFilter():
-    stationList = []
+    # None means that reports of all stations are decoded
+    stationList = None
     countryList = None
 
     if settings.filterfile:
@@ -133,14 +256,62 @@ def setupFilter():
         else:
             countryList = '[A-Z]{2}'
 
-        if 'stations' in filterSpec and 'synop' in filterSpec['stations']:
-            stationList = filterSpec['stations']['synop']
+        if 'stations' in filterSpec and 'synop' in filterSpec['stations'] and filterSpec['stations']['synop']:
+            stationList = set(filterSpec['stations']['synop'])
+
+        if 'regions' in filterSpec:
+            if not isinstance(filterSpec['regions'], list):
+                sys.exit('The regions in the filter file have to be a list of regions. Exiting.')
+            if stationList == None:
+                stationList = set()
+            stationList.update(resolveRegions(filterSpec['regions']))
     else:
         countryList = '[A-Z]{2}'
 
     setattr(settings, 'stationList', stationList)
     setattr(settings, 'countryList', countryList)
 
+# returns the WMO ids of all stations in the inventory located within one of the regions
+def resolveRegions(regions):
+    grid = buildStationGrid(settings.stationInventory)
+    stationList = set()
+    for region in regions:
+        try:
+            if 'box' in region:
+                minLat, minLon, maxLat, maxLon = [float(x) for x in region['box']]
+                checkCoordinates(minLat, minLon)
+                checkCoordinates(maxLat, maxLon)
+                # min lon > max lon is a box crossing the antimeridian, min lat > max lat is a mistake
+                if minLat > maxLat:
+                    raise ValueError
+                stations = stationsInBox(grid, minLat, minLon, maxLat, maxLon)
+            elif 'polygon' in region:
+                polygon = [(float(corner[0]), float(corner[1])) for corner in region['polygon']]
+                if len(polygon) < 3:
+                    raise ValueError
+                for corner in polygon:
+                    checkCoordinates(corner[0], corner[1])
+                stations = stationsInPolygon(grid, polygon)
+            elif 'point' in region and 'radius' in region:
+                lat, lon = [float(x) for x in region['point']]
+                checkCoordinates(lat, lon)
+                radius = float(region['radius'])
+                if not radius > 0:
+                    raise ValueError
+                stations = stationsInRadius(grid, lat, lon, radius)
+            else:
+                raise ValueError
+        except (IndexError, TypeError, ValueError):
+            sys.exit('The region ' + str(region) + ' in the filter file is invalid. Exiting.')
+        verbosePrint('region ' + str(region) + ' contains ' + str(len(stations)) + ' stations.')
+        stationList.update([station[0] for station in stations])
+    return stationList
+
+# invalid regions would silently match no stations and filter out everything
+def checkCoordinates(lat, lon):
+    if not -90.0 <= lat <= 90.0 or not -180.0 <= lon <= 180.0:
+        raise ValueError
+
 def setupStationInventory():
     stationInventory = {}
     try:
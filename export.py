@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+import csv
+import datetime
+from output import closeParquetFile
+from output import openParquetFile
+from output import writeParquetRows
+import os
+import settings
+import sqlite3
+import sys
+
+# columns of the station table added to exported synop and synop_daily rows
+stationColumns = ['icao', 'lat', 'lon', 'ele', 'name', 'int_name']
+
+# exports the contents of a Sqlite output, i.e. including corrections, amendments and station metadata
+# rows are streamed from the database in chunks, so memory usage does not depend on the size of the export
+def main():
+
+    parser = argparse.ArgumentParser(description='Exports decoded data from a Sqlite output to CSV or Parquet files.')
+    parser.add_argument('database',
+                        metavar='database',
+                        help='the Sqlite output file to export from')
+    parser.add_argument('output',
+                        metavar='output-file',
+                        help='the file where to write exported data')
+    parser.add_argument('-t', '--type', dest='outputtype',
+                        metavar='output-type',
+                        help='Format of the exported data. One of csv and parquet (requires pyarrow). Defaults to csv.',
+                        required=False,
+                        choices=['csv', 'parquet'],
+                        default='csv')
+    parser.add_argument('--table', dest='table',
+                        metavar='table',
+                        help='Table to export. One of synop, synop_daily and station. Defaults to synop.',
+                        required=False,
+                        choices=['synop', 'synop_daily', 'station'],
+                        default='synop')
+    parser.add_argument('--from', dest='start',
+                        metavar='start',
+                        help='(yyyy-mm-dd or yyyy-mm-dd HH:MM) export only data from this time on',
+                        required=False,
+                        default=None)
+    parser.add_argument('--to', dest='end',
+                        metavar='end',
+                        help='(yyyy-mm-dd or yyyy-mm-dd HH:MM) export only data before this time',
+                        required=False,
+                        default=None)
+    parser.add_argument('--stations', dest='stations',
+                        metavar='stations',
+                        help='comma separated list of WMO identifiers of stations to export',
+                        required=False,
+                        default=None)
+    parser.add_argument('-c', '--chunk-size', dest='chunkSize',
+                        metavar='chunk-size',
+                        help='Number of rows fetched from the database at once. Defaults to 10000.',
+                        required=False,
+                        type=int,
+                        default=10000)
+    args = parser.parse_args()
+
+    for name, value in vars(args).items():
+        setattr(settings, name, value)
+
+    if settings.chunkSize < 1:
+        sys.exit('The chunk size has to be at least 1. Exiting.')
+
+    query, parameters = buildQuery()
+
+    # connecting would create an empty database instead of failing
+    if not os.path.isfile(settings.database):
+        sys.exit('The database ' + settings.database + ' does not exist. Exiting.')
+
+    try:
+        connection = sqlite3.connect(settings.database)
+        cursor = connection.cursor()
+        cursor.execute(query, parameters)
+    except sqlite3.Error as e:
+        sys.exit('Could not read from database ' + settings.database + ': ' + str(e) + '. Exiting.')
+
+    columns = [description[0] for description in cursor.description]
+    openExport, writeRows, closeExport = exportTypes[settings.outputtype]
+    export = openExport(settings.output, columns, columnTypes(cursor, columns))
+
+    count = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(settings.chunkSize)
+            if not rows:
+                break
+            writeRows(export, rows)
+            count += len(rows)
+    finally:
+        closeExport(export)
+        connection.close()
+
+    print('Exported ' + str(count) + ' rows from table ' + settings.table + ' to ' + settings.output + '.')
+
+# returns the query selecting the exported rows and its parameters
+# filters are part of the query, so that Sqlite can use the primary key index or, for time ranges of all stations,
+# the time index (see output.openSqliteOutput) to find the rows
+# rows are ordered like the used index, so they are streamed without sorting them first
+def buildQuery():
+    conditions = []
+    parameters = []
+
+    if settings.table == 'station':
+        if settings.start or settings.end:
+            sys.exit('The station table can not be filtered by time. Exiting.')
+        query = 'SELECT station.* FROM station'
+    else:
+        query = 'SELECT ' + settings.table + '.*, ' + ', '.join(['station.' + column for column in stationColumns]) \
+            + ' FROM ' + settings.table + ' LEFT JOIN station ON station.wmo = ' + settings.table + '.wmo'
+
+        # timestamps are stored as yyyy-mm-dd HH:MM:SS and dates as yyyy-mm-dd, so they can be compared as text
+        if settings.table == 'synop':
+            timeColumn = 'synop.timestamp'
+            timeFormat = '%Y-%m-%d %H:%M:%S'
+        else:
+            timeColumn = 'synop_daily.date'
+            timeFormat = '%Y-%m-%d'
+        if settings.start:
+            conditions.append(timeColumn + ' >= ?')
+            parameters.append(parseTime(settings.start).strftime(timeFormat))
+        if settings.end:
+            conditions.append(timeColumn + ' < ?')
+            parameters.append(parseTime(settings.end).strftime(timeFormat))
+
+    if settings.stations:
+        try:
+            stations = [int(station) for station in settings.stations.split(',')]
+        except ValueError:
+            sys.exit('The specified stations have to be WMO identifiers separated by commas. Exiting.')
+        conditions.append(settings.table + '.wmo IN (' + ', '.join(['?'] * len(stations)) + ')')
+        parameters.extend(stations)
+
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+
+    if settings.table == 'station':
+        query += ' ORDER BY station.wmo'
+    elif (settings.start or settings.end) and not settings.stations:
+        # the order of the time index
+        query += ' ORDER BY ' + timeColumn + ', ' + settings.table + '.wmo'
+    else:
+        # the order of the primary key
+        query += ' ORDER BY ' + settings.table + '.wmo, ' + timeColumn
+
+    return (query, parameters)
+
+def parseTime(value):
+    for timeFormat in ['%Y-%m-%d %H:%M', '%Y-%m-%d']:
+        try:
+            return datetime.datetime.strptime(value, timeFormat)
+        except ValueError:
+            pass
+    sys.exit('The specified time ' + value + ' seems to be invalid. Exiting.')
+
+# Parquet column types (see output.parquetType) by declared Sqlite type, columns of other types are exported as text
+sqliteColumnTypes = {'INTEGER': 'integer', 'REAL': 'real'}
+
+# types of the exported columns derived from their declared types, used for typing columnar exports
+def columnTypes(cursor, columns):
+    declaredTypes = {}
+    for table in [settings.table, 'station']:
+        for column in cursor.connection.execute('PRAGMA table_info(' + table + ')'):
+            declaredTypes.setdefault(column[1], column[2].upper())
+    return [sqliteColumnTypes.get(declaredTypes.get(column), 'text') for column in columns]
+
+def openCsvExport(fileName, columns, types):
+    try:
+        exportFile = open(fileName, 'w')
+    except IOError:
+        sys.exit('Could not open output file. Exiting.')
+    writer = csv.writer(exportFile, quoting=csv.QUOTE_ALL, delimiter=',')
+    writer.writerow(columns)
+    return (exportFile, writer)
+
+def writeCsvRows(export, rows):
+    exportFile, writer = export
+    try:
+        for row in rows:
+            writer.writerow([value.encode('utf-8') if isinstance(value, unicode) else value for value in row])
+    except IOError:
+        sys.exit('Could not write to output file. Exiting.')
+
+def closeCsvExport(export):
+    exportFile, writer = export
+    exportFile.close()
+
+# functions for opening an export, writing a chunk of rows to it and closing it again, by output type
+# Parquet exports are written like the Parquet output, every chunk becomes a row group
+exportTypes = {
+    'csv': (openCsvExport, writeCsvRows, closeCsvExport),
+    'parquet': (openParquetFile, writeParquetRows, closeParquetFile)
+}
+
+if __name__ == "__main__":
+    main()
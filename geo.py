@@ -0,0 +1,117 @@
+import math
+
+# mean earth radius in km
+earthRadius = 6371.0
+# edge length of grid cells in degrees
+cellSize = 1.0
+
+# spatial index over station coordinates
+# stations are put into cells of a regular lat/lon grid, so a query only has to
+# look at the stations in the cells overlapping the query region
+# instead of at every station in the inventory
+def buildStationGrid(stationInventory):
+    grid = {}
+    for wmo, station in stationInventory.items():
+        try:
+            lat = float(station['lat'])
+            lon = float(station['lon'])
+            wmo = int(wmo)
+        except (KeyError, TypeError, ValueError):
+            # station without usable id or coordinates can not be located
+            continue
+        grid.setdefault(gridCell(lat, lon), []).append((wmo, lat, lon))
+    return grid
+
+def gridCell(lat, lon):
+    return (int(math.floor(lat / cellSize)), int(math.floor(lon / cellSize)))
+
+# returns all stations within the box as (wmo, lat, lon) tuples
+# a box with minLon > maxLon crosses the antimeridian
+def stationsInBox(grid, minLat, minLon, maxLat, maxLon):
+    if minLon > maxLon:
+        return stationsInBox(grid, minLat, minLon, maxLat, 180.0) + stationsInBox(grid, minLat, -180.0, maxLat, maxLon)
+
+    minCell = gridCell(minLat, minLon)
+    maxCell = gridCell(maxLat, maxLon)
+    stations = []
+    for latCell in range(minCell[0], maxCell[0] + 1):
+        for lonCell in range(minCell[1], maxCell[1] + 1):
+            for station in grid.get((latCell, lonCell), []):
+                if minLat <= station[1] <= maxLat and minLon <= station[2] <= maxLon:
+                    stations.append(station)
+    return stations
+
+# polygon is a list of [lat, lon] corners
+# a polygon with an edge spanning more than 180 degrees of longitude crosses the antimeridian
+def stationsInPolygon(grid, polygon):
+    crossing = False
+    previous = polygon[-1]
+    for corner in polygon:
+        if abs(corner[1] - previous[1]) > 180.0:
+            crossing = True
+        previous = corner
+    if crossing:
+        # continue eastern longitudes beyond 180 degrees so that the polygon is contiguous
+        polygon = [(corner[0], unwrapLon(corner[1])) for corner in polygon]
+
+    lats = [corner[0] for corner in polygon]
+    lons = [corner[1] for corner in polygon]
+    # a box with minLon > maxLon after wrapping crosses the antimeridian as well
+    candidates = stationsInBox(grid, min(lats), wrapLon(min(lons)), max(lats), wrapLon(max(lons)))
+    if crossing:
+        return [station for station in candidates if insidePolygon(station[1], unwrapLon(station[2]), polygon)]
+    return [station for station in candidates if insidePolygon(station[1], station[2], polygon)]
+
+def unwrapLon(lon):
+    if lon < 0:
+        return lon + 360.0
+    return lon
+
+# ray casting: a point is inside if a ray starting at it crosses the polygon edges an odd number of times
+def insidePolygon(lat, lon, polygon):
+    inside = False
+    previous = polygon[-1]
+    for corner in polygon:
+        if (corner[0] > lat) != (previous[0] > lat):
+            crossingLon = corner[1] + (lat - corner[0]) * (previous[1] - corner[1]) / (previous[0] - corner[0])
+            if lon < crossingLon:
+                inside = not inside
+        previous = corner
+    return inside
+
+# radius in km
+def stationsInRadius(grid, lat, lon, radius):
+    # box around the circle to select candidates
+    latDelta = math.degrees(radius / earthRadius)
+    minLat = max(lat - latDelta, -90.0)
+    maxLat = min(lat + latDelta, 90.0)
+    lonDelta = 180.0
+    # longitude degrees get shorter towards the poles, so the latitude closest to a pole is decisive
+    if minLat > -90.0 and maxLat < 90.0:
+        lonDelta = latDelta / math.cos(math.radians(max(abs(minLat), abs(maxLat))))
+    if lonDelta >= 180.0:
+        # circle contains a pole or wraps around the earth, all longitudes are affected
+        minLon = -180.0
+        maxLon = 180.0
+    else:
+        minLon = wrapLon(lon - lonDelta)
+        maxLon = wrapLon(lon + lonDelta)
+
+    candidates = stationsInBox(grid, minLat, minLon, maxLat, maxLon)
+    return [station for station in candidates if distance(lat, lon, station[1], station[2]) <= radius]
+
+def wrapLon(lon):
+    if lon < -180.0:
+        return lon + 360.0
+    if lon > 180.0:
+        return lon - 360.0
+    return lon
+
+# great circle distance in km (haversine formula)
+def distance(lat1, lon1, lat2, lon2):
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+    dLat = lat2 - lat1
+    dLon = math.radians(lon2 - lon1)
+    a = math.sin(dLat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dLon / 2) ** 2
+    return 2 * earthRadius * math.asin(min(1.0, math.sqrt(a)))
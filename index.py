@@ -0,0 +1,97 @@
+from __future__ import print_function
+import os
+import re
+import settings
+
+# use NOAA bulletin separator line to split up bulletins, the digits are the sequence number
+bulletinSeparator = re.compile('####([0-9]{9})####')
+
+# TTAAii CCCC YYGGgg (BBB), see bulletin.processBulletin
+bulletinHeader = re.compile('^([A-Z]{4}[0-9]{2}) ([A-Z]{4}) ([0-9]{6})(?: ((?:AA|CC|RR)[A-Z]))?(?: |$)')
+
+# first line of an index, followed by the size and modification time of the indexed file
+indexHeader = '# bulletin index'
+
+# the sidecar index of an input file lists all its bulletins with their header and position,
+# so that selected bulletins can be read without reading and splitting the whole file
+def indexFileName(inputFileName):
+    return inputFileName + '.idx'
+
+# returns (sequence number, offset, length) of the bulletins in the raw file contents
+# the text before the first separator is returned as well, without sequence number
+def splitBulletins(data):
+    sequence = None
+    offset = 0
+    for separator in bulletinSeparator.finditer(data):
+        yield (sequence, offset, separator.start() - offset)
+        sequence = separator.group(1)
+        offset = separator.end()
+    yield (sequence, offset, len(data) - offset)
+
+def normalizeBulletin(bulletin):
+    # convert newlines into spaces and remove carriage returns
+    bulletin = bulletin.replace('\n', ' ')
+    bulletin = bulletin.replace('\r', '')
+    # collapse spaces
+    return ' '.join(bulletin.split())
+
+# an index entry is a tuple (sequence, TTAAii, CCCC, YYGGgg, BBB, offset, length)
+# with None for missing values
+def indexEntry(sequence, bulletin, offset, length):
+    header = bulletinHeader.match(bulletin)
+    if header:
+        return (sequence, header.group(1), header.group(2), header.group(3), header.group(4), offset, length)
+    return (sequence, None, None, None, None, offset, length)
+
+def writeIndex(inputFileName, entries):
+    fileStat = os.stat(inputFileName)
+    try:
+        indexFile = open(indexFileName(inputFileName), 'w')
+        indexFile.write(indexHeader + ' ' + str(fileStat.st_size) + ' ' + str(int(fileStat.st_mtime)) + '\n')
+        for entry in entries:
+            # one line per bulletin, - for missing values
+            indexFile.write(' '.join(['-' if value == None else str(value) for value in entry]) + '\n')
+        indexFile.close()
+    except IOError:
+        print('Could not write index file ' + indexFileName(inputFileName) + '.')
+
+# returns the index entries of the input file
+# or None if there is no index or it does not match the file (anymore)
+def readIndex(inputFileName):
+    try:
+        indexFile = open(indexFileName(inputFileName), 'r')
+        lines = indexFile.readlines()
+        indexFile.close()
+        fileStat = os.stat(inputFileName)
+    except (IOError, OSError):
+        return None
+
+    if not lines or lines[0].strip() != indexHeader + ' ' + str(fileStat.st_size) + ' ' + str(int(fileStat.st_mtime)):
+        return None
+
+    entries = []
+    for line in lines[1:]:
+        values = [None if value == '-' else value for value in line.split()]
+        if len(values) != 7:
+            return None
+        try:
+            entries.append(tuple(values[:5]) + (int(values[5]), int(values[6])))
+        except (TypeError, ValueError):
+            return None
+    return entries
+
+# whether the bulletin of the entry matches the bulletin, issuer and sequence number selection
+def selectedEntry(entry):
+    sequence, bulletinId, issuer = entry[0], entry[1], entry[2]
+    if settings.selectBulletins != None:
+        if bulletinId == None or not any(bulletinId.startswith(prefix) for prefix in settings.selectBulletins):
+            return False
+    if settings.selectIssuers != None and issuer not in settings.selectIssuers:
+        return False
+    if settings.selectSequence != None:
+        if sequence == None or not settings.selectSequence[0] <= int(sequence) <= settings.selectSequence[1]:
+            return False
+    return True
+
+def selecting():
+    return settings.selectBulletins != None or settings.selectIssuers != None or settings.selectSequence != None
@@ -1,5 +1,11 @@
 import math
+try:
+    import cPickle as pickle
+except ImportError:
+    # Python 3, benchmark.py counts allocations with it
+    import pickle
 import settings
+import struct
 
 def relHumidity(temp, dewPointTemp):
     # approximation based on Magnus formula
@@ -44,3 +50,25 @@ def computeQFF(pressure, temperature, elevation, latitude):
 def verbosePrint(output):
     if settings.verbose:
         print(output)
+
+# messages between decoders and the writer service are pickled objects prefixed by their length
+messageHeader = struct.Struct('!Q')
+
+def sendMessage(connection, message):
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    connection.sendall(messageHeader.pack(len(data)) + data)
+
+# raises EOFError if the connection is closed before a complete message arrived
+def receiveMessage(connection):
+    length = messageHeader.unpack(receiveBytes(connection, messageHeader.size))[0]
+    return pickle.loads(receiveBytes(connection, length))
+
+def receiveBytes(connection, length):
+    chunks = []
+    while length > 0:
+        chunk = connection.recv(min(length, 65536))
+        if not chunk:
+            raise EOFError
+        chunks.append(chunk)
+        length -= len(chunk)
+    return ''.join(chunks)
@@ -1,55 +1,83 @@
+from __future__ import print_function
 import csv
 import datetime
+from lib import receiveMessage
+from lib import sendMessage
 import settings
+import socket
 import sqlite3
+import sys
+
+# columns of the flat outputs (CSV and Parquet), daily values are not part of them
+flatColumns = ['bulletin_id', 'bulletin_issuer', 'station_id',
+    'timestamp', 'modifier_type', 'modifier_sequence', 'temperature', 'dew_point_temperature',
+    'rel_humidity', 'wind_direction', 'wind_speed', 'gust_speed', 'station_pressure', 'pressure',
+    'cloud_cover', 'sun_duration', 'precipitation_amount', 'precipitation_duration', 'current_weather', 'snow_depth']
+
+# records are shared by all outputs, so they must not be changed
+# flat outputs use this copy of a record instead
+def flattenRecord(record):
+    row = {}
+    for column in flatColumns:
+        row[column] = record.get(column)
+
+    if record['modifier'] != None:
+        row['modifier_type'] = record['modifier']['type']
+        row['modifier_sequence'] = record['modifier']['sequence']
+
+    if record['precipitation'] != None:
+        # not possible to write more than one precipitation entry to flat outputs
+        for precip in record['precipitation']:
+            if precip != None:
+                row['precipitation_amount'] = precip['amount']
+                row['precipitation_duration'] = precip['duration']
+            break
+
+    return row
 
 # CSV output provides a simple dumping of decoded values
 # advanced functions like correcting data according to bulletin modifiers will not be done
 # as the CSV file is newly created every time
 # also station information is not saved in the CSV file
-def writeCsvOutput():
+def openCsvOutput(fileName):
     try:
         print()
-        print('Writing to CSV output file ' + settings.output + '...')
-        outputFile = open(settings.output, 'w')
-        writer = csv.DictWriter(outputFile, fieldnames=['bulletin_id', 'bulletin_issuer', 'station_id',
-            'timestamp', 'modifier_type', 'modifier_sequence', 'temperature', 'dew_point_temperature',
-            'rel_humidity', 'wind_direction', 'wind_speed', 'gust_speed', 'station_pressure', 'pressure',
-            'cloud_cover', 'sun_duration', 'precipitation_amount', 'precipitation_duration', 'current_weather', 'snow_depth'],
-            quoting=csv.QUOTE_ALL, delimiter=',')
-
-        writer.writeheader()
-        for dataRow in settings.decodedData:
-            if dataRow['modifier'] != None:
-                dataRow['modifier_type'] = dataRow['modifier']['type']
-                dataRow['modifier_sequence'] = dataRow['modifier']['sequence']
-            else:
-                dataRow['modifier_type'] = None
-                dataRow['modifier_sequence'] = None
-            del dataRow['modifier']
-
-            if dataRow['precipitation'] != None:
-                # not possible to write more than one precipitation entry to CSV
-                for precip in dataRow['precipitation']:
-                    if precip != None:
-                        dataRow['precipitation_amount'] = precip['amount']
-                        dataRow['precipitation_duration'] = precip['duration']
-                    break
-            else:
-                dataRow['precipitation_amount'] = None
-                dataRow['precipitation_duration'] = None
-            del dataRow['precipitation']
-
-            writer.writerow(dataRow)
+        print('Writing to CSV output file ' + fileName + '...')
+        outputFile = open(fileName, 'w')
     except IOError:
         sys.exit('Could not open output file. Exiting.')
+    writer = csv.DictWriter(outputFile, fieldnames=flatColumns, quoting=csv.QUOTE_ALL, delimiter=',')
+
+    writer.writeheader()
+    return (outputFile, writer)
+
+def writeCsvRecords(output, records):
+    outputFile, writer = output
+    try:
+        for record in records:
+            writer.writerow(flattenRecord(record))
+        outputFile.flush()
+    except IOError:
+        sys.exit('Could not write to output file. Exiting.')
+
+def closeCsvOutput(output):
+    outputFile, writer = output
+    outputFile.close()
 
-def writeSqliteOutput():
+def openSqliteOutput(fileName):
     print()
-    print('Writing to Sqlite output container ' + settings.output + '...')
-    connection = sqlite3.connect(settings.output)
+    print('Writing to Sqlite output container ' + fileName + '...')
+    # other processes may be writing to the same file, wait for their locks instead of failing
+    # transactions are started explicitly, see writeSqliteRecords
+    # the connection may be used by another thread than the opening one, but only by one at a time (see writer.py)
+    connection = sqlite3.connect(fileName, timeout=settings.busyTimeout, isolation_level=None, check_same_thread=False)
     cursor = connection.cursor()
 
+    # in WAL mode readers do not block the writer and vice versa
+    # the mode is stored in the database file, so it also applies to all other connections
+    if settings.wal:
+        cursor.execute('PRAGMA journal_mode=WAL')
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS station (
             wmo INTEGER PRIMARY KEY,
@@ -92,12 +120,25 @@ def writeSqliteOutput():
             amendment_sequence TEXT,
             PRIMARY KEY(wmo, timestamp))
     ''')
+    # export.py selects rows by time, also without selecting stations, which the primary keys do not cover
+    # such rows are exported in the order of these indexes, so they are streamed without sorting
+    cursor.execute('CREATE INDEX IF NOT EXISTS synop_timestamp_wmo ON synop (timestamp, wmo)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS synop_daily_date_wmo ON synop_daily (date, wmo)')
     # todo precipitation
     connection.commit()
 
+    return connection
+
+# writes a batch of records and commits them in a single transaction
+def writeSqliteRecords(connection, records):
+    cursor = connection.cursor()
+    # take the write lock right away, daily values are read before being updated
+    # and must not be changed by another process in between
+    cursor.execute('BEGIN IMMEDIATE')
+
     stations = []
     synop = []
-    for dataRow in settings.decodedData:
+    for dataRow in records:
         station = settings.stationInventory[dataRow['station_id']]
         # make sure station ends up in list only once
         duplicates = filter(lambda data: data[0] == dataRow['station_id'], stations)
@@ -127,7 +168,6 @@ def writeSqliteOutput():
                 else:
                     cursor.execute('INSERT INTO synop_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
                         (station, date.strftime("%Y-%m-%d"), None, None, dataRow['daily_precipitation'], None, '', ''))
-                connection.commit()
 
             if dataRow['daily_sun_duration'] != None:
                 date = dataRow['timestamp'] - datetime.timedelta(days=1)
@@ -139,23 +179,21 @@ def writeSqliteOutput():
                 else:
                     cursor.execute('INSERT INTO synop_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
                         (station, date.strftime("%Y-%m-%d"), None, None, None, dataRow['daily_sun_duration'], '', ''))
-                connection.commit()
 
     # IGNORE means that it does not fail if the key already exists
     cursor.executemany('INSERT OR IGNORE INTO station VALUES (?, ?, ?, ?, ?, ?, ?)', stations)
     cursor.executemany('INSERT OR IGNORE INTO synop VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', synop)
-    connection.commit()
 
-    amendments = filter(lambda data: data['modifier'] != None and data['modifier']['type'] == 'AA', settings.decodedData)
+    amendments = filter(lambda data: data['modifier'] != None and data['modifier']['type'] == 'AA', records)
 
     for amendment in amendments:
-        idTuple = (correction['station_id'], correction['timestamp'])
+        idTuple = (amendment['station_id'], amendment['timestamp'])
         cursor.execute('SELECT * FROM synop WHERE wmo = ? AND timestamp = ?', idTuple)
         result = cursor.fetchone()
         # insert only if data is either not in the DB
         # or the amendment sequence is not present (i.e. has not been amended so far)
         # or the amendment sequence is lower (i.e. our amendment is newer)
-        if result == None or result[15] == None or result[15] < correction['modifier']['sequence']:
+        if result == None or result[15] == None or result[15] < amendment['modifier']['sequence']:
             if result != None:
                 correctionSeq = result[14]
             else:
@@ -166,10 +204,9 @@ def writeSqliteOutput():
                     amendment['rel_humidity'], amendment['wind_direction'], amendment['wind_speed'],
                     amendment['gust_speed'], amendment['station_pressure'], amendment['pressure'],
                     amendment['cloud_cover'], amendment['sun_duration'], amendment['current_weather'], amendment['snow_depth'],
-                    amendmentSeq, amendment['modifier']['sequence']))
-    connection.commit()
+                    correctionSeq, amendment['modifier']['sequence']))
 
-    corrections = filter(lambda data: data['modifier'] != None and data['modifier']['type'] == 'CC', settings.decodedData)
+    corrections = filter(lambda data: data['modifier'] != None and data['modifier']['type'] == 'CC', records)
 
     for correction in corrections:
         idTuple = (correction['station_id'], correction['timestamp'])
@@ -192,4 +229,124 @@ def writeSqliteOutput():
                     correction['modifier']['sequence'], amendmentSeq))
     connection.commit()
 
+def closeSqliteOutput(connection):
+    connection.close()
+
+# Parquet output is a columnar version of the CSV output, every batch of records becomes a row group
+def openParquetOutput(fileName):
+    print()
+    print('Writing to Parquet output file ' + fileName + '...')
+    return openParquetFile(fileName, flatColumns, [parquetColumnTypes[column] for column in flatColumns])
+
+def writeParquetRecords(output, records):
+    rows = []
+    for record in records:
+        row = flattenRecord(record)
+        rows.append([row[column] for column in flatColumns])
+    writeParquetRows(output, rows)
+
+def closeParquetOutput(output):
+    closeParquetFile(output)
+
+# Parquet files are written by the Parquet output and by export.py
+# they require pyarrow, which is only imported if a Parquet file is written
+# columnTypes are the types of the columns (text, timestamp, integer or real), see parquetType
+def openParquetFile(fileName, columns, columnTypes):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        sys.exit('Parquet output requires pyarrow, please install it. Exiting.')
+
+    schema = pyarrow.schema([pyarrow.field(column, parquetType(pyarrow, columnType)) for column, columnType in zip(columns, columnTypes)])
+    try:
+        writer = pyarrow.parquet.ParquetWriter(fileName, schema)
+    except (IOError, pyarrow.ArrowException):
+        sys.exit('Could not open output file. Exiting.')
+    return (pyarrow, schema, columnTypes, writer)
+
+# writes the rows, lists of values in the order of the columns, as a row group
+def writeParquetRows(parquetFile, rows):
+    pyarrow, schema, columnTypes, writer = parquetFile
+    arrays = []
+    for index, values in enumerate(zip(*rows)):
+        values = [parquetValue(value, columnTypes[index]) for value in values]
+        arrays.append(pyarrow.array(values, type=schema[index].type))
+    try:
+        writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+    except (IOError, pyarrow.ArrowException):
+        sys.exit('Could not write to output file. Exiting.')
+
+def closeParquetFile(parquetFile):
+    pyarrow, schema, columnTypes, writer = parquetFile
+    writer.close()
+
+# station ids are kept as text because of leading zeros
+parquetColumnTypes = {
+    'bulletin_id': 'text', 'bulletin_issuer': 'text', 'station_id': 'text', 'timestamp': 'timestamp',
+    'modifier_type': 'text', 'modifier_sequence': 'text', 'temperature': 'real', 'dew_point_temperature': 'real',
+    'rel_humidity': 'real', 'wind_direction': 'integer', 'wind_speed': 'real', 'gust_speed': 'real',
+    'station_pressure': 'real', 'pressure': 'real', 'cloud_cover': 'integer', 'sun_duration': 'real',
+    'precipitation_amount': 'real', 'precipitation_duration': 'integer', 'current_weather': 'integer', 'snow_depth': 'real'
+}
+
+def parquetType(pyarrow, columnType):
+    if columnType == 'text':
+        return pyarrow.string()
+    elif columnType == 'timestamp':
+        return pyarrow.timestamp('s')
+    elif columnType == 'integer':
+        return pyarrow.int64()
+    return pyarrow.float64()
+
+# decoded values are not always of the column type, e.g. cloud cover is decoded as text
+# and speeds are integers unless converted from knots
+# neither are exported ones, as Sqlite does not enforce the declared types of its columns
+# values which can not be converted, e.g. a cloud cover which is not a digit, are written as missing
+# instead of failing the batch for all outputs
+def parquetValue(value, columnType):
+    if value == None or value == '':
+        return None
+    try:
+        if columnType == 'text':
+            return unicode(value)
+        elif columnType == 'integer':
+            return int(value)
+        elif columnType == 'real':
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return value
+
+# the socket output sends the records to a writer service (see writer.py) listening on a Unix socket
+# which writes them to its Sqlite output, so several decoders can share a database without lock contention
+def openSocketOutput(socketName):
+    print()
+    print('Sending to writer service at ' + socketName + '...')
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socketName)
+    except socket.error:
+        sys.exit('Could not connect to writer service at ' + socketName + ', please check if it is running. Exiting.')
+    return connection
+
+# sends a batch of records and waits until the service has written it
+def writeSocketRecords(connection, records):
+    try:
+        sendMessage(connection, records)
+        error = receiveMessage(connection)
+    except (socket.error, EOFError):
+        sys.exit('Lost connection to writer service. Exiting.')
+    if error != None:
+        sys.exit('Writer service could not write records: ' + error + '. Exiting.')
+
+def closeSocketOutput(connection):
     connection.close()
+
+# functions for opening an output, writing a batch of records to it and closing it again, by output type
+outputTypes = {
+    'csv': (openCsvOutput, writeCsvRecords, closeCsvOutput),
+    'sqlite': (openSqliteOutput, writeSqliteRecords, closeSqliteOutput),
+    'socket': (openSocketOutput, writeSocketRecords, closeSocketOutput),
+    'parquet': (openParquetOutput, writeParquetRecords, closeParquetOutput)
+}
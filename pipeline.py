@@ -0,0 +1,215 @@
+from __future__ import print_function
+from bulletin import processBulletin
+from index import indexEntry
+from index import indexFileName
+from index import normalizeBulletin
+from index import readIndex
+from index import selectedEntry
+from index import selecting
+from index import splitBulletins
+from index import writeIndex
+from lib import verbosePrint
+import multiprocessing
+from output import outputTypes
+import Queue
+import settings
+import sys
+import threading
+import time
+import traceback
+
+# put on a queue by a stage when it has no more items to deliver
+endOfStream = None
+# put on the record queue by a decoder process which failed
+decoderFailed = 'decoder failed'
+
+# decoding runs in three stages connected by bounded queues:
+# one reader thread reading and splitting the input files into bulletins,
+# a number of decoder threads turning bulletins into records
+# and one writer thread which owns the outputs and writes the records in batches to all of them
+# a full queue blocks the stage in front of it, so a slow stage throttles the others
+# instead of letting bulletins or records pile up in memory
+# decoders run as processes instead of threads if settings.processes is set,
+# so that decoding can use more than one CPU
+# inputFiles is a list of (file name, base date) tuples, sinks a list of (output type, output file) tuples
+def runPipeline(inputFiles, sinks):
+    if settings.processes:
+        bulletinQueue = multiprocessing.Queue(maxsize=settings.queueSize)
+        recordQueue = multiprocessing.Queue(maxsize=settings.queueSize)
+    else:
+        bulletinQueue = Queue.Queue(maxsize=settings.queueSize)
+        recordQueue = Queue.Queue(maxsize=settings.queueSize)
+    # the first error of any stage, the other stages wind down when it is set
+    errors = []
+    progress = {'files': 0, 'bulletins': 0, 'records': 0, 'start': time.time()}
+
+    stages = [threading.Thread(target=readerStage, args=(inputFiles, bulletinQueue, errors, progress))]
+    for i in range(settings.workers):
+        if settings.processes:
+            # errors of a process do not reach this one, they are reported on the record queue
+            stages.append(multiprocessing.Process(target=decoderStage, args=(bulletinQueue, recordQueue, None)))
+        else:
+            stages.append(threading.Thread(target=decoderStage, args=(bulletinQueue, recordQueue, errors)))
+    stages.append(threading.Thread(target=writerStage,
+        args=(recordQueue, sinks, errors, progress)))
+
+    for stage in stages:
+        stage.daemon = True
+        stage.start()
+    for stage in stages:
+        # join with timeout so that the main thread stays responsive to interrupts
+        while stage.is_alive():
+            stage.join(1)
+
+    if not errors:
+        duration = time.time() - progress['start']
+        print()
+        print('Decoded ' + str(progress['records']) + ' reports from ' + str(progress['bulletins']) + ' bulletins in '
+            + str(progress['files']) + ' files in ' + str(round(duration, 1)) + ' s ('
+            + str(round(progress['records'] / max(duration, 0.001), 1)) + ' reports/s).')
+    else:
+        error = errors[0]
+        if error[0] == SystemExit:
+            sys.exit(error[1].code)
+        raise error[0], error[1], error[2]
+
+def readerStage(inputFiles, bulletinQueue, errors, progress):
+    try:
+        for inputFileName, basedate in inputFiles:
+            if errors:
+                break
+            print()
+            print('Processing input file ' + inputFileName + ' (' + str(progress['files'] + 1) + ' of '
+                + str(len(inputFiles)) + ', base date ' + basedate.strftime('%Y-%m-%d') + ').')
+            count = 0
+            for number, bulletin in readBulletins(inputFileName):
+                if errors:
+                    break
+                count += 1
+                bulletinQueue.put((bulletin, number, basedate))
+            progress['files'] += 1
+            progress['bulletins'] += count
+    except BaseException:
+        errors.append(sys.exc_info())
+    finally:
+        # every decoder stops after receiving one end marker
+        for i in range(settings.workers):
+            bulletinQueue.put(endOfStream)
+
+# yields (number, bulletin) tuples of the bulletins of the input file, only the selected ones if there is a selection
+# selected bulletins are read directly from their position if the file has an up to date index
+# the number is the position of the bulletin in the file, also if only selected bulletins are read
+def readBulletins(inputFileName):
+    entries = None
+    if selecting():
+        entries = readIndex(inputFileName)
+
+    try:
+        inputFile = open(inputFileName, 'rb')
+        if entries != None:
+            verbosePrint('reading selected bulletins using index ' + indexFileName(inputFileName) + '.')
+            for number, entry in enumerate(entries, 1):
+                if selectedEntry(entry):
+                    inputFile.seek(entry[5])
+                    yield (number, normalizeBulletin(inputFile.read(entry[6])))
+            inputFile.close()
+            return
+        data = inputFile.read()
+        inputFile.close()
+    except IOError:
+        sys.exit('Could not read input file ' + inputFileName + ', please check if it exists. Exiting.')
+
+    entries = []
+    for sequence, offset, length in splitBulletins(data):
+        bulletin = normalizeBulletin(data[offset:offset + length])
+        # first one will be usually empty
+        if len(bulletin) == 0:
+            continue
+        entry = indexEntry(sequence, bulletin, offset, length)
+        entries.append(entry)
+        if selectedEntry(entry):
+            yield (len(entries), bulletin)
+
+    if settings.index:
+        writeIndex(inputFileName, entries)
+
+def decoderStage(bulletinQueue, recordQueue, errors):
+    try:
+        while True:
+            item = bulletinQueue.get()
+            if item is endOfStream:
+                break
+            # keep consuming after an error so that the reader does not block on a full queue
+            if errors:
+                continue
+            bulletin, count, basedate = item
+            records = processBulletin(bulletin, count, basedate)
+            if records:
+                recordQueue.put(records)
+    except BaseException:
+        if errors == None:
+            traceback.print_exc()
+            recordQueue.put(decoderFailed)
+        else:
+            errors.append(sys.exc_info())
+        # drain the remaining bulletins for the same reason
+        while bulletinQueue.get() is not endOfStream:
+            pass
+    finally:
+        recordQueue.put(endOfStream)
+
+def writerStage(recordQueue, sinks, errors, progress):
+    # (output type, opened output) tuples
+    outputs = []
+    finishedDecoders = 0
+    # reports which have already been written, used for skipping duplicates
+    reports = set()
+    batch = []
+    try:
+        for outputType, outputFile in sinks:
+            outputs.append((outputType, outputTypes[outputType][0](outputFile)))
+        while finishedDecoders < settings.workers:
+            records = recordQueue.get()
+            if records is endOfStream:
+                finishedDecoders += 1
+                continue
+            if records == decoderFailed:
+                sys.exit('Decoding failed in a decoder process. Exiting.')
+            # keep consuming after an error so that the decoders do not block on a full queue
+            if errors:
+                continue
+            for record in records:
+                key = reportKey(record)
+                if key in reports:
+                    verbosePrint('Skipping duplicate report from station ' + record['station_id'] + '.')
+                    continue
+                reports.add(key)
+                batch.append(record)
+            if len(batch) >= settings.batchSize:
+                writeBatch(outputs, batch, progress)
+                batch = []
+        if batch and not errors:
+            writeBatch(outputs, batch, progress)
+    except BaseException:
+        errors.append(sys.exc_info())
+        while finishedDecoders < settings.workers:
+            if recordQueue.get() is endOfStream:
+                finishedDecoders += 1
+    finally:
+        for outputType, output in outputs:
+            outputTypes[outputType][2](output)
+
+# all outputs get the same records, decoding is done only once however many outputs there are
+def writeBatch(outputs, batch, progress):
+    for outputType, output in outputs:
+        outputTypes[outputType][1](output, batch)
+    progress['records'] += len(batch)
+    duration = time.time() - progress['start']
+    print('progress: ' + str(progress['files']) + ' files and ' + str(progress['bulletins']) + ' bulletins read, '
+        + str(progress['records']) + ' reports written (' + str(round(progress['records'] / max(duration, 0.001), 1)) + ' reports/s).')
+
+# a report is a duplicate if the same station, timestamp and bulletin modifier occured before
+def reportKey(record):
+    if record['modifier'] != None:
+        return (record['station_id'], record['timestamp'], record['modifier']['type'], record['modifier']['sequence'])
+    return (record['station_id'], record['timestamp'], None, None)
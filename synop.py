@@ -4,17 +4,9 @@ from lib import relHumidity
 from lib import verbosePrint
 import settings
 
+# returns the decoded report as a record
+# duplicate reports are skipped when writing, see pipeline.writerStage
 def processSynop(stationId, timestamp, windIndicator, bulletinId, bulletinIssuer, modifierType, modifierSequence, synop):
-    # skip station if duplicate
-    duplicates = filter(lambda data: data['station_id'] == stationId and data['timestamp'] == timestamp, settings.decodedData)
-    for duplicate in duplicates:
-        if duplicate['modifier'] == None and modifierType == None and modifierSequence == None:
-            verbosePrint('Skipping duplicate report from station ' + stationId + '.')
-            return
-        elif duplicate['modifier'] != None and duplicate['modifier']['type'] == modifierType and duplicate['modifier']['sequence'] == modifierSequence:
-            verbosePrint('Skipping duplicate report from station ' + stationId + '.')
-            return
-
     print('decoding report from station ' + stationId + '.')
     verbosePrint(synop)
 
@@ -274,7 +266,7 @@ def processSynop(stationId, timestamp, windIndicator, bulletinId, bulletinIssuer
         data['daily_precipitation'] = None
         data['daily_sun_duration'] = None
 
-    settings.decodedData.append(data)
+    return data
 
 def decodePrecipitation(precipGroup):
     precipitation = {}
@@ -313,3 +305,346 @@ def decodePrecipitation(precipGroup):
         precipitation = None
 
     return precipitation
+
+# alternative to processSynop working on the bytes of the report
+# instead of creating a substring and calling int() or float() for every field,
+# fields are read in place by their offsets and digits are converted using a lookup table
+# the decoded record is identical to the one of processSynop, compare.py checks this and benchmark.py measures both
+def processSynopBytes(stationId, timestamp, windIndicator, bulletinId, bulletinIssuer, modifierType, modifierSequence, synop):
+    print('decoding report from station ' + stationId + '.')
+    verbosePrint(synop)
+
+    data = {}
+    data['station_id'] = stationId
+    data['timestamp'] = timestamp
+    data['bulletin_id'] = bulletinId
+    data['bulletin_issuer'] = bulletinIssuer
+    data['modifier'] = None
+
+    if modifierType != None and modifierSequence != None:
+        data['modifier'] = {'type': modifierType, 'sequence': modifierSequence}
+
+    # the only copy of the report, all sections and groups are offsets into it
+    buffer = bytearray(synop)
+
+    # split SYNOP into its parts
+    landEnd = buffer.find(b' 333 ')
+    if landEnd == -1:
+        landEnd = len(buffer)
+        clim = landEnd
+        climEnd = landEnd
+    else:
+        clim = landEnd + 5
+        climEnd = buffer.find(b' 333 ', clim)
+        if climEnd == -1:
+            climEnd = len(buffer)
+    # discard regional section 5 if present
+    # like processSynop this also cuts off the last character before it
+    regional = buffer.find(b' 555 ', clim, climEnd)
+    if regional != -1:
+        if regional > clim:
+            climEnd = regional - 1
+        else:
+            climEnd -= 1
+
+    # iihVV - precipitation and weather indicators, visibility
+    land = 0
+    # cloud base and visibility are omitted
+    land += 6
+
+    # Nddff - cloud cover, wind direction and speed
+    data['cloud_cover'] = byteChar(buffer, land, landEnd)
+    if data['cloud_cover'] == '/':
+        data['cloud_cover'] = None
+    data['wind_direction'] = fieldValue(buffer, land + 1, land + 3, landEnd)
+    if data['wind_direction'] != None:
+        data['wind_direction'] *= 10
+    data['wind_speed'] = fieldValue(buffer, land + 3, land + 5, landEnd)
+    # wind speed may be > 99, look for 00fff
+    if data['wind_speed'] == 99 and byteAt(buffer, land + 6, landEnd) == zero and byteAt(buffer, land + 7, landEnd) == zero:
+        data['wind_speed'] = requiredFieldValue(buffer, land + 8, land + 11, landEnd)
+        land += 12
+    else:
+        land += 6
+    # wind is specified in knots, have to convert to m/s
+    if (windIndicator == 3 or windIndicator == 4) and data['wind_speed'] != None:
+        data['wind_speed'] = round(data['wind_speed'] * 0.514444, 2)
+    # if no wind indicator omit wind data to avoid inconsistencies
+    if windIndicator == -1:
+        data['wind_direction'] = None
+        data['wind_speed'] = None
+
+    # 1sTTT - temperature
+    if byteAt(buffer, land, landEnd) == one:
+        value = fieldValue(buffer, land + 2, land + 5, landEnd, True)
+        sign = byteAt(buffer, land + 1, landEnd)
+        if value == None or sign == slash:
+            # no temperature sign, omit temperature altogether
+            data['temperature'] = None
+        else:
+            # temperature is specified in 10ths of degrees
+            data['temperature'] = value / 10
+            # negative temperature
+            if sign == one:
+                data['temperature'] = 0 - data['temperature']
+        land += 6
+    else:
+        data['temperature'] = None
+
+    # 2sTTT (or 29UUU) - dew point temperature or relative humidity
+    if byteAt(buffer, land, landEnd) == two:
+        sign = fieldValue(buffer, land + 1, land + 2, landEnd)
+        value = fieldValue(buffer, land + 2, land + 5, landEnd, True)
+        if sign == None or value == None:
+            data['dew_point_temperature'] = None
+            data['rel_humidity'] = None
+        elif sign == 9:
+            data['dew_point_temperature'] = None
+            data['rel_humidity'] = value
+        else:
+            data['dew_point_temperature'] = value / 10
+            if sign == 1:
+                data['dew_point_temperature'] = 0 - data['dew_point_temperature']
+            data['rel_humidity'] = round(relHumidity(data['temperature'], data['dew_point_temperature']), 1)
+        land += 6
+    else:
+        data['dew_point_temperature'] = None
+        data['rel_humidity'] = None
+
+    # 3PPPP - pressure at station level
+    if byteAt(buffer, land, landEnd) == three:
+        if byteAt(buffer, land + 4, landEnd) == slash:
+            data['station_pressure'] = fieldValue(buffer, land + 1, land + 4, landEnd)
+        else:
+            data['station_pressure'] = fieldValue(buffer, land + 1, land + 5, landEnd, True)
+            if data['station_pressure'] != None:
+                data['station_pressure'] /= 10
+
+        # is there a better cutoff level?
+        if data['station_pressure'] != None and data['station_pressure'] < 200:
+            data['station_pressure'] += 1000
+
+        if stationId in settings.stationInventory:
+            data['pressure'] = computeQFF(data['station_pressure'], data['temperature'],
+                settings.stationInventory[stationId]['ele'], settings.stationInventory[stationId]['lat'])
+        else:
+            data['pressure'] = None
+        land += 6
+    else:
+        data['station_pressure'] = None
+        data['pressure'] = None
+
+    # 4PPPP group omitted because reduced pressure (QFF) is computed
+    if byteAt(buffer, land, landEnd) == four:
+        land += 6
+
+    # 5appp - pressure tendency and amount of change omitted
+    if byteAt(buffer, land, landEnd) == five:
+        land += 6
+
+    # 6RRRt - precipitation amount and time frame
+    # as in processSynop the precipitation indicator does not change the result
+    if byteAt(buffer, land, landEnd) == six:
+        data['precipitation'] = [decodePrecipitationBytes(buffer, land, min(land + 5, landEnd))]
+        land += 6
+    else:
+        data['precipitation'] = None
+
+    if byteAt(buffer, land, landEnd) == seven:
+        data['current_weather'] = fieldValue(buffer, land + 1, land + 3, landEnd)
+        land += 6
+    else:
+        data['current_weather'] = None
+
+    # 8NCCC - cloud type information - omitted
+    # 9GGgg - time of observation - omitted
+
+    ### climatological part
+    if clim < climEnd:
+
+        # discard everything before 4...
+        while clim < climEnd and leadingDigit(buffer, clim) < 4:
+            clim += 6
+
+        # 4Esss - snow depth
+        if byteAt(buffer, clim, climEnd) == four:
+            data['snow_depth'] = fieldValue(buffer, clim + 2, clim + 5, climEnd)
+            if data['snow_depth'] == 997:
+                data['snow_depth'] = 0.5
+            elif data['snow_depth'] == 998:
+                data['snow_depth'] = 0.01
+            elif data['snow_depth'] == 999:
+                data['snow_depth'] = None
+            clim += 6
+        else:
+            data['snow_depth'] = None
+
+        # 55SSS - daily hours of sunshine (of the previous day) in 10ths of hours
+        while clim < climEnd and leadingDigit(buffer, clim) < 6 and not startsWith(buffer, clim, climEnd, b'55'):
+            clim += 6
+
+        if startsWith(buffer, clim, climEnd, b'55') and not startsWith(buffer, clim, climEnd, b'553'):
+            data['daily_sun_duration'] = fieldValue(buffer, clim + 2, clim + 5, climEnd, True)
+            if data['daily_sun_duration'] != None:
+                data['daily_sun_duration'] /= 10
+            clim += 6
+        else:
+            data['daily_sun_duration'] = None
+
+        # 553SS - duration of sunshine in the last hour in 10ths of hours
+        while clim < climEnd and leadingDigit(buffer, clim) < 6 and not startsWith(buffer, clim, climEnd, b'553'):
+            clim += 6
+
+        if startsWith(buffer, clim, climEnd, b'553'):
+            data['sun_duration'] = fieldValue(buffer, clim + 3, clim + 5, climEnd, True)
+            if data['sun_duration'] != None:
+                data['sun_duration'] /= 10
+            clim += 6
+        else:
+            data['sun_duration'] = None
+
+        while clim < climEnd and leadingDigit(buffer, clim) < 6:
+            clim += 6
+        # 6RRRt - amount and duration of precipitation (like in Section 1)
+        if byteAt(buffer, clim, climEnd) == six:
+            precipitation = decodePrecipitationBytes(buffer, clim, min(clim + 5, climEnd))
+            if data['precipitation'] == None:
+                data['precipitation'] = [precipitation]
+            elif precipitation != None:
+                data['precipitation'].append(precipitation)
+            clim += 6
+
+        # 7RRRR - total amount of precipitation in the last 24 hours
+        if byteAt(buffer, clim, climEnd) == seven:
+            data['daily_precipitation'] = fieldValue(buffer, clim + 1, clim + 5, climEnd, True)
+            if data['daily_precipitation'] != None:
+                data['daily_precipitation'] /= 10
+                if data['daily_precipitation'] == 999.9:
+                    data['daily_precipitation'] = 0.05
+            clim += 6
+        else:
+            data['daily_precipitation'] = None
+
+        while clim < climEnd and leadingDigit(buffer, clim) < 9:
+            clim += 6
+
+        # 910ff - highest gust in the last 10 min
+        while clim < climEnd and leadingDigit(buffer, clim) == 9 and not startsWith(buffer, clim, climEnd, b'910'):
+            clim += 6
+        if startsWith(buffer, clim, climEnd, b'910'):
+            data['gust_speed'] = fieldValue(buffer, clim + 3, clim + 5, climEnd)
+            # gust speed may be > 99, look for 00fff
+            if data['gust_speed'] == 99 and byteAt(buffer, clim + 6, climEnd) == zero and byteAt(buffer, clim + 7, climEnd) == zero:
+                data['gust_speed'] = requiredFieldValue(buffer, clim + 8, clim + 11, climEnd)
+                clim += 12
+            else:
+                clim += 6
+            # speed is specified in knots, have to convert to m/s
+            if (windIndicator == 3 or windIndicator == 4) and data['gust_speed'] != None:
+                data['gust_speed'] = round(data['gust_speed'] * 0.514444, 2)
+            # if no wind indicator omit wind data to avoid inconsistencies
+            if windIndicator == -1:
+                data['gust_speed'] = None
+        else:
+            data['gust_speed'] = None
+        # 911ff - highest gust during the period covered by past weather - omitted
+    else:
+        data['snow_depth'] = None
+        data['sun_duration'] = None
+        data['gust_speed'] = None
+        data['daily_precipitation'] = None
+        data['daily_sun_duration'] = None
+
+    return data
+
+def decodePrecipitationBytes(buffer, start, end):
+    amount = fieldValue(buffer, start + 1, start + 4, end, True)
+    duration = fieldValue(buffer, start + 4, start + 5, end)
+    if amount == None or duration == None or duration == 0:
+        return None
+
+    if amount == 990:
+        amount = 0.05
+    elif amount > 990:
+        amount = (amount - 990) / 10
+
+    return {'amount': amount, 'duration': precipitationDurations[duration]}
+
+# hours of precipitation duration by code figure, 0 is invalid
+precipitationDurations = [None, 6, 12, 18, 24, 1, 2, 3, 9, 15]
+
+zero = ord('0')
+one = ord('1')
+two = ord('2')
+three = ord('3')
+four = ord('4')
+five = ord('5')
+six = ord('6')
+seven = ord('7')
+slash = ord('/')
+
+# value of every byte as a decimal digit, -1 if it is not a digit
+digitValues = [-1] * 256
+for digit in range(10):
+    digitValues[zero + digit] = digit
+
+def byteAt(buffer, index, end):
+    if index < end:
+        return buffer[index]
+    return -1
+
+# the character at index as returned by a one character slice of the report
+def byteChar(buffer, index, end):
+    if index < end:
+        return chr(buffer[index])
+    return ''
+
+def startsWith(buffer, start, end, prefix):
+    return start + len(prefix) <= end and buffer.startswith(prefix, start)
+
+# the number in the field from start to stop (exclusive) or None if it is not a number
+# same as int() or, if asFloat is set, float() on the slice of the report
+def fieldValue(buffer, start, stop, end, asFloat=False):
+    if stop > end:
+        stop = end
+    if start >= stop:
+        return None
+
+    # fields usually consist of digits only
+    value = 0
+    index = start
+    while index < stop:
+        digit = digitValues[buffer[index]]
+        if digit == -1:
+            return paddedFieldValue(buffer, start, stop, asFloat)
+        value = value * 10 + digit
+        index += 1
+
+    if asFloat:
+        return float(value)
+    return value
+
+# fieldValue for fields containing anything else than digits, e.g. padding, a sign or a decimal point
+# rare enough to simply convert the text of the field exactly like processSynop does
+def paddedFieldValue(buffer, start, stop, asFloat):
+    field = bytes(buffer[start:stop])
+    try:
+        if asFloat:
+            return float(field)
+        return int(field)
+    except ValueError:
+        return None
+
+# like fieldValue for fields processSynop parses without handling errors
+def requiredFieldValue(buffer, start, stop, end):
+    value = fieldValue(buffer, start, stop, end)
+    if value == None:
+        raise ValueError('invalid field in report')
+    return value
+
+# the digit at the start of a group, raises ValueError for anything else like int() in processSynop
+def leadingDigit(buffer, index):
+    digit = digitValues[buffer[index]]
+    if digit == -1:
+        raise ValueError('invalid group in report')
+    return digit
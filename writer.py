@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import argparse
+from decode import setupStationInventory
+import errno
+from lib import receiveMessage
+from lib import sendMessage
+from lib import verbosePrint
+import os
+from output import closeSqliteOutput
+from output import openSqliteOutput
+from output import writeSqliteRecords
+import Queue
+import settings
+import signal
+import socket
+import SocketServer
+import sqlite3
+import stat
+import sys
+import threading
+
+# put on the write queue when the service shuts down
+endOfStream = None
+
+# the writer service owns the Sqlite output and writes all record batches sent to it by decoders
+# (decode.py with output type socket) one after another on a single connection
+# so that several decoders can run at the same time without competing for the database lock
+def main():
+
+    parser = argparse.ArgumentParser(description='Writes records sent by decoders to a Sqlite output.')
+    parser.add_argument('stationInventory',
+                        metavar='station-inventory',
+                        help='CSV file containing station metadata')
+    parser.add_argument('output',
+                        metavar='output-file',
+                        help='the Sqlite output file where to write decoded data')
+    parser.add_argument('socket',
+                        metavar='socket',
+                        help='the Unix socket where to listen for decoders')
+    parser.add_argument('-v', '--verbose', dest='verbose',
+                        help='print verbose output of received batches',
+                        action='store_true')
+    parser.add_argument('--wal', dest='wal',
+                        help='switch the Sqlite output to WAL mode, so that readers and the writer do not block each other',
+                        action='store_true')
+    parser.add_argument('--busy-timeout', dest='busyTimeout',
+                        metavar='seconds',
+                        help='How long to wait for other processes to release the lock of the Sqlite output. Defaults to 30.',
+                        required=False,
+                        type=float,
+                        default=30)
+    args = parser.parse_args()
+
+    for name, value in vars(args).items():
+        setattr(settings, name, value)
+
+    setupStationInventory()
+
+    if os.path.exists(settings.socket):
+        removeStaleSocket(settings.socket)
+
+    # opened before listening, so that decoders never connect to a service which can not write
+    try:
+        connection = openSqliteOutput(settings.output)
+    except sqlite3.Error as e:
+        sys.exit('Could not open Sqlite output ' + settings.output + ': ' + str(e) + '. Exiting.')
+
+    writeQueue = Queue.Queue()
+    writerThread = threading.Thread(target=writeBatches, args=(connection, writeQueue))
+    writerThread.start()
+
+    # records are pickled, so only the owner may talk to the service
+    # the socket is created with these permissions, there is no moment in which others could connect
+    umask = os.umask(0o077)
+    try:
+        server = WriterServer(settings.socket, WriterHandler)
+    finally:
+        os.umask(umask)
+    server.writeQueue = writeQueue
+    server.writerThread = writerThread
+    # service managers stop the service with SIGTERM, it shuts down like on an interrupt
+    signal.signal(signal.SIGTERM, terminate)
+    print('Listening for decoders at ' + settings.socket + '.')
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        os.remove(settings.socket)
+        writeQueue.put(endOfStream)
+        writerThread.join()
+
+# a socket left behind by a service which was killed is removed, it is stale if nobody accepts connections on it
+def removeStaleSocket(socketName):
+    if not stat.S_ISSOCK(os.stat(socketName).st_mode):
+        sys.exit(socketName + ' already exists and is not a socket. Exiting.')
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socketName)
+    except socket.error as e:
+        if e.errno != errno.ECONNREFUSED:
+            sys.exit('Could not check the socket ' + socketName + ': ' + str(e) + '. Exiting.')
+        print('Removing stale socket ' + socketName + '.')
+        os.remove(socketName)
+        return
+    finally:
+        probe.close()
+    sys.exit('Another writer service is listening at ' + socketName + '. Exiting.')
+
+def terminate(signalNumber, frame):
+    sys.exit()
+
+class WriterServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+# one handler thread per connected decoder, it hands the batches over to the writer thread
+class WriterHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                records = receiveMessage(self.request)
+            except EOFError:
+                break
+            reply = Queue.Queue(maxsize=1)
+            self.server.writeQueue.put((records, reply))
+            # the decoder waits for the batch to be written before sending the next one
+            sendMessage(self.request, self.waitForReply(reply))
+
+    # returns the reply of the writer thread, or an error if the writer thread has stopped
+    # and the batch will never be written
+    def waitForReply(self, reply):
+        while True:
+            try:
+                return reply.get(timeout=1)
+            except Queue.Empty:
+                if not self.server.writerThread.is_alive():
+                    return 'writer service stopped writing'
+
+def writeBatches(connection, writeQueue):
+    try:
+        while True:
+            item = writeQueue.get()
+            if item is endOfStream:
+                break
+            records, reply = item
+            try:
+                writeSqliteRecords(connection, records)
+                verbosePrint('wrote batch of ' + str(len(records)) + ' records.')
+                reply.put(None)
+            except Exception as e:
+                connection.rollback()
+                reply.put(str(e))
+    finally:
+        closeSqliteOutput(connection)
+
+if __name__ == "__main__":
+    main()